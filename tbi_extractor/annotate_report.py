@@ -1,13 +1,121 @@
 """Report markup with revisions for omitted, duplicate, and derived targets."""
 import logging
+from collections import Counter, defaultdict
 
+import numpy as np
 import pandas as pd
 
 
 log = logging.getLogger(__name__)
 
-
-def run(df, target_list):
+# Lexical modifier groups that annotations can take
+MODIFIER_GROUPS = [
+    "present",
+    "suspected",
+    "indeterminate",
+    "absent",
+    "abnormal",
+    "normal",
+]
+
+# Lexical targets that annotations can take, as in the lexical targets tsv;
+# sorted, so that sorting on the categorical column is alphabetical
+ALL_TARGETS = (
+    "aneurysm",
+    "anoxic",
+    "atrophy",
+    "cistern",
+    "contusion",
+    "diffuse_axonal",
+    "edema",
+    "edh",
+    "facial_fracture",
+    "fluid",
+    "gray_white_differentiation",
+    "hemorrhage",
+    "herniation",
+    "hydrocephalus",
+    "hyperdensities",
+    "hypodensities",
+    "intracranial_pathology",
+    "iph",
+    "ischemia",
+    "ivh",
+    "mass_effect",
+    "microhemorrhage",
+    "midline_shift",
+    "pneumocephalus",
+    "sah",
+    "sdh",
+    "skull_fracture",
+)
+
+# Categorical dtypes of the target group and modifier group columns; target
+# groups are ordered, so sorting compares the integer codes
+TARGET_GROUP_DTYPE = pd.CategoricalDtype(ALL_TARGETS, ordered=True)
+MODIFIER_GROUP_DTYPE = pd.CategoricalDtype(MODIFIER_GROUPS)
+
+# Lexical targets annotated as normal or abnormal, rather than present or absent
+NORMAL_ABNORMAL_TARGETS = ["cistern", "gray_white_differentiation"]
+
+# Lexical targets of specific hemorrhages, from which hemorrhage NOS and
+# extraaxial fluid collection are derived
+SPECIFIC_HEMORRHAGES = frozenset(
+    {
+        "epidural_hemorrhage",
+        "subarachnoid_hemorrhage",
+        "subdural_hemorrhage",
+    }
+)
+HEMORRHAGE_PRESENT_GROUPS = frozenset({"present", "suspected"})
+
+# Lexical targets of specific pathologies, from which intracranial pathology
+# is derived
+PATHOLOGY_TARGETS = frozenset(
+    {
+        "gray_white_differentiation",
+        "cistern",
+        "hydrocephalus",
+        "pneumocephalus",
+        "midline_shift",
+        "mass_effect",
+        "diffuse_axonal",
+        "anoxic",
+        "herniation",
+        "aneurysm",
+        "contusion",
+        "fluid",
+        "swelling",
+        "ischemia",
+        "hemorrhage",
+        "intraventricular_hemorrhage",
+        "intraparenchymal_hemorrage",
+    }
+)
+PATHOLOGY_PRESENT_GROUPS = frozenset({"present", "suspected", "abnormal"})
+
+# Order in which tied lexical modifier groups are selected for duplicate targets;
+# absent first for the targets derived from other targets, otherwise present first
+ABSENT_FIRST_TARGETS = ["fluid", "hemorrhage", "intracranial_pathology"]
+ABSENT_FIRST_PRIORITY = {
+    "absent": 0,
+    "indeterminate": 1,
+    "suspected": 2,
+    "present": 3,
+    "normal": 4,
+    "abnormal": 5,
+}
+PRESENT_FIRST_PRIORITY = {
+    "present": 0,
+    "suspected": 1,
+    "indeterminate": 2,
+    "absent": 3,
+    "abnormal": 4,
+    "normal": 5,
+}
+
+
+def run(df, target_list, columns=None):
     """Orchestrate report annotation.
 
     Args:
@@ -17,39 +125,47 @@ def run(df, target_list):
 
         target_list (list): unique list of target phrases used for annotation.
 
+        columns (list): columns of the output, in order, including the target
+            group. Default: None, resulting in all columns.
+
     Returns:
         df (pandas.core.frame.DataFrame): dataframe containing each identified
             target phrase with its associated modifer phrase; the target group
-            and modifier group are also returned.
+            and modifier group are also returned. Sorted by target group.
 
     """
     # Ommitted targets: add targets that are missing from output based on
     # unique target list; default to absent or normal, depending upon target
-    df.reset_index(inplace=True, drop="index")
     df = ommitted_targets(df, target_list)
 
+    # Target and modifier groups come from small, fixed vocabularies; as
+    # categoricals, the comparisons below are performed on integer codes
+    df = categorize_groups(df, target_list)
+
     # Duplicate targets: if duplicate lexical targets are identified,
     # the majority vote is selected
-    df.reset_index(inplace=True, drop="index")
     df = duplicate_targets(df)
 
     # Change modifier group to match those given to physicians
-    df.reset_index(inplace=True, drop="index")
     df = modifier_type_physician_match(df, target_list)
 
-    # Derived targets:
-    # Change hemorrhage NOS annotation to absent, if specific hemorrhages exist
-    df.reset_index(inplace=True, drop="index")
-    df = is_specific_hemorrhage(df)
+    # Row positions of each target group; rows are no longer added or removed
+    # below, so the derived targets look up their rows instead of scanning
+    groups = target_group_rows(df)
+
+    # Derived targets, in one pass over the annotations:
+    # change hemorrhage NOS annotation to absent, if specific hemorrhages exist;
+    # change extraaxial fluid collection annotation to present/suspected,
+    # if specific hemorrhages present/suspected;
+    # change intracranial pathology annotation to present, if pathology exists
+    df = derive_targets(df, groups)
 
-    # Change extraaxial fluid collection annotation to present/suspected,
-    # if specific hemorrhages present/suspected
-    df.reset_index(inplace=True, drop="index")
-    df = is_extraaxial_fluid_collection(df)
+    # Output with the requested columns, sorted by target group; the sort
+    # also resets the index, rather than in a separate pass
+    if columns is not None:
+        df = df[columns]
 
-    # Change intracranial pathology annotation to present, if pathology exists
-    df.reset_index(inplace=True, drop="index")
-    df = is_intracranial_pathology(df)
+    df = df.sort_values("target_group", kind="stable", ignore_index=True)
 
     return df
 
@@ -81,22 +197,77 @@ def ommitted_targets(df, target_list):
         "modifier_group",
     ]
 
-    for target in targets_not_in_report:
+    # Nothing to add if all targets were found in the report
+    if not targets_not_in_report:
+        return df
+
+    # Default rows for all missing targets, added to the report in one step
+    df_default = pd.DataFrame(
+        [
+            [target, target, "default", default_modifier_group(target)]
+            for target in targets_not_in_report
+        ],
+        columns=output_columns,
+    )
 
-        if target == "cistern" or target == "gray_white_differentiation":
-            df_default = pd.DataFrame(
-                [[target, target, "default", "normal"]], columns=output_columns
-            )
-            df = pd.concat([df, df_default], sort=False)
-            # df = df.append(df_default, sort=False)
+    # No target found in the report, only the default rows remain
+    if df.empty:
+        return df_default
 
-        else:
-            df_default = pd.DataFrame(
-                [[target, target, "default", "absent"]], columns=output_columns
-            )
-            df = pd.concat([df, df_default], sort=False)
-            # df = df.append(df_default, sort=False)
-            # df = df.append(df_default, sort=False)
+    df = pd.concat([df, df_default], sort=False, ignore_index=True)
+
+    return df
+
+
+def default_modifier_group(target):
+    """Default lexical modifier group for a lexical target not found in the
+    report: normal for abnormal/normal targets, otherwise absent."""
+
+    if target in NORMAL_ABNORMAL_TARGETS:
+        return "normal"
+
+    return "absent"
+
+
+def categorize_groups(df, target_list):
+    """Convert the target group and modifier group columns to categoricals.
+
+    Args:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase; the target group
+            and modifier group are also returned.
+
+        target_list (list): unique list of target phrases used for annotation.
+
+    Returns:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase; the target group
+            and modifier group are also returned.
+
+    """
+    # Categories are fixed, so the dtypes are only built once; groups outside
+    # the vocabularies, e.g. from an edited lexicon, are added to the categories
+    target_groups = set(target_list) | set(df["target_group"])
+    modifier_groups = set(df["modifier_group"])
+
+    target_dtype = TARGET_GROUP_DTYPE
+    if not target_groups.issubset(ALL_TARGETS):
+        target_dtype = pd.CategoricalDtype(
+            sorted(target_groups | set(ALL_TARGETS)), ordered=True
+        )
+
+    modifier_dtype = MODIFIER_GROUP_DTYPE
+    if not modifier_groups.issubset(MODIFIER_GROUPS):
+        modifier_dtype = pd.CategoricalDtype(
+            MODIFIER_GROUPS + sorted(modifier_groups - set(MODIFIER_GROUPS))
+        )
+
+    df = df.astype(
+        {
+            "target_group": target_dtype,
+            "modifier_group": modifier_dtype,
+        }
+    )
 
     return df
 
@@ -125,322 +296,267 @@ def duplicate_targets(df):
             and modifier group are also returned.
 
     """
-    # Find duplicate target_groups
-    duplicate_groups = df[df.duplicated(subset="target_group", keep=False)]
-    unique_target_groups = set(duplicate_groups["target_group"].tolist())
+    output_columns = [
+        "target_phrase",
+        "target_group",
+        "modifier_phrase",
+        "modifier_group",
+    ]
 
-    # Check modifier type for duplicate groups and replace with
-    # maximum vote or ordering if equal number of annotations
-    for target_group in unique_target_groups:
+    # The frame has a few rows per report, so the vote is resolved on the
+    # column arrays in Python rather than with pandas operations per group
+    target_phrases = df["target_phrase"].to_numpy()
+    target_groups = df["target_group"].to_numpy()
+    modifier_phrases = df["modifier_phrase"].to_numpy()
+    modifier_groups = df["modifier_group"].to_numpy()
+
+    target_rows = defaultdict(list)
+    for row, target_group in enumerate(target_groups):
+        target_rows[target_group].append(row)
+
+    rows = []
+    first_rows = []
+    for target_group, group_rows in target_rows.items():
+
+        # Check modifier type for the target group and select the maximum vote,
+        # or ordering if equal number of annotations
+        modifier_group = majority_modifier_group(
+            target_group, [modifier_groups[row] for row in group_rows]
+        )
 
-        modifier_types = duplicate_groups.loc[
-            duplicate_groups["target_group"] == target_group, "modifier_group"
+        # Targets with the selected modifier type are combined to one row
+        group_rows = [
+            row for row in group_rows if modifier_groups[row] == modifier_group
         ]
-        counts = modifier_types.value_counts()
-        who_is_max = counts[counts == counts.max()]
-
-        if len(who_is_max) > 0:
-            df = combine_duplicate_targets_modifiers(
-                df, target_group, pd.Series(who_is_max.index)
+        first_rows.append(group_rows[0])
+        rows.append(
+            (
+                unique_join(target_phrases[group_rows]),
+                target_group,
+                unique_join(modifier_phrases[group_rows]),
+                modifier_group,
             )
+        )
 
-        # Check for duplicate targets with the same modifier type,
-        # then combine them to one row and continue
-        df = combine_matching_targets_modifiers(df, target_group)
+    # Combined rows are kept in order of their first occurrence in the report
+    rows = [row for _, row in sorted(zip(first_rows, rows))]
 
-    return df
+    return pd.DataFrame(rows, columns=output_columns).astype(
+        {
+            "target_group": df["target_group"].dtype,
+            "modifier_group": df["modifier_group"].dtype,
+        }
+    )
 
 
-def combine_duplicate_targets_modifiers(df, target_group, modifier_group):
-    """Combine duplicates of lexical target to lexical modifier group"""
+def majority_modifier_group(target_group, modifier_groups):
+    """Modifier group with the maximum vote for the target group; ties are
+    broken by the selection order of the modifier groups for the target."""
 
-    if target_group in ["fluid", "hemorrhage", "intracranial_pathology"]:
-        modifiers = [
-            "absent",
-            "indeterminate",
-            "suspected",
-            "present",
-            "normal",
-            "abnormal",
-        ]
+    if target_group in ABSENT_FIRST_TARGETS:
+        priority = ABSENT_FIRST_PRIORITY
     else:
-        modifiers = [
-            "present",
-            "suspected",
-            "indeterminate",
-            "absent",
-            "abnormal",
-            "normal",
-        ]
+        priority = PRESENT_FIRST_PRIORITY
 
-    # In order of list of modifiers, go through and drop all that are not that modifier
-    for modifier in modifiers:
+    votes = Counter(modifier_groups)
+    max_vote = max(votes.values())
 
-        if modifier in modifier_group.tolist():
+    return min(
+        (group for group, vote in votes.items() if vote == max_vote),
+        key=lambda group: priority.get(group, len(priority)),
+    )
 
-            drop_index = df.loc[
-                (
-                    (df["target_group"] == target_group)
-                    & (df["modifier_group"] != modifier)
-                )
-            ].index
 
-            df.drop(index=drop_index, axis=1, inplace=True)
+def unique_join(phrases):
+    """Concatenate the unique phrases, in order of appearance."""
+    return ", ".join(dict.fromkeys(phrases))
 
-            # If drop occured, then break loop as we are done removing
-            break
 
-    return df
+def join_phrases(phrases):
+    """Concatenate the phrases of a series; empty if there are none."""
+    return ", ".join(phrases.to_numpy().tolist())
 
 
-def combine_matching_targets_modifiers(df, target_group):
-    """Concatenate modifier phrase targets for matching target group and
-    modifier group."""
+def modifier_type_physician_match(df, target_list):
+    """Change modifier groups to match those given to physicians; these are
+    also stored in the lexical targets tsv."""
+
+    target_groups = df["target_group"]
+    modifier_groups = df["modifier_group"]
 
-    # If modifier groups are equivalent for the target group,
-    # only one will be retained; modifier phrases concatenated
-    concat_modifiers = (
-        df.loc[(df["target_group"] == target_group), "modifier_phrase"]
-        .drop_duplicates(keep="first")
-        .str.cat(sep=", ")
+    # Find where items are not default modified; the modifier phrases of each
+    # target group are concatenated and broadcast to its rows
+    modifiers = (
+        df["modifier_phrase"]
+        .where(df["modifier_phrase"] != "default")
+        .groupby(target_groups, observed=True)
+        .transform(lambda phrases: join_phrases(phrases.dropna()))
     )
+    is_modified = modifiers != ""
 
-    # Replace modifiers for all items in the target group
-    df.loc[(df["target_group"] == target_group), "modifier_phrase"] = concat_modifiers
+    # Change modifier group for abnormal/normal annotations; lexical targets in
+    # abnormal list can either be normal or abnormal
+    is_abnormal_list = is_modified & target_groups.isin(NORMAL_ABNORMAL_TARGETS)
 
-    # The target phrases are concatenated
-    concat_targets = (
-        df.loc[(df["target_group"] == target_group), "target_phrase"]
-        .drop_duplicates(keep="first")
-        .str.cat(sep=", ")
+    normals = ["normal", "absent"]
+    is_normal = (
+        modifier_groups.isin(normals)
+        .groupby(target_groups, observed=True)
+        .transform("any")
+    )
+    abnormals = ["abnormal", "present", "suspected", "indeterminate"]
+    is_abnormal = (
+        modifier_groups.isin(abnormals)
+        .groupby(target_groups, observed=True)
+        .transform("any")
     )
 
-    # Replace targets for all items in target group
-    df.loc[(df["target_group"] == target_group), "target_phrase"] = concat_targets
-
-    # Rows will now be duplicates for target groups with same modifier group
-    df.drop_duplicates(
-        subset=["target_group", "modifier_group"], keep="first", inplace=True
+    # If "abnormal" not present and "normal" present, then mark item as "normal";
+    # if "abnormal" present, then mark item as "abnormal"
+    to_normal = is_abnormal_list & is_normal & ~is_abnormal
+    to_abnormal = is_abnormal_list & is_abnormal
+
+    # Change modifier group for present/suspected/indeterminate/absent annotations:
+    # if 'abnormal' in modifier types, change to 'present';
+    # if 'normal' in modifier types, change to 'absent'
+    is_present_list = (
+        is_modified
+        & target_groups.isin(target_list)
+        & ~target_groups.isin(NORMAL_ABNORMAL_TARGETS)
     )
+    to_present = is_present_list & (modifier_groups == "abnormal")
+    to_absent = is_present_list & (modifier_groups == "normal")
+
+    for is_changed, physician_modifier in [
+        (to_normal, "normal"),
+        (to_abnormal, "abnormal"),
+        (to_present, "present"),
+        (to_absent, "absent"),
+    ]:
+        df.loc[is_changed, "modifier_group"] = physician_modifier
+
+    is_changed = to_normal | to_abnormal | to_present | to_absent
+    df.loc[is_changed, "modifier_phrase"] = modifiers[is_changed].to_numpy()
 
     return df
 
 
-def modifier_type_physician_match(df, target_list):
-    """Change modifier groups to match those given to physicians; these are
-    also stored in the lexical targets tsv."""
+def target_group_rows(df):
+    """Row positions of each target group in the dataframe.
 
-    # Change modifier group for abnormal/normal annotations
-    for item in ["cistern", "gray_white_differentiation"]:
-
-        # Find where item is not default modified
-        modifiers = df.loc[
-            ((df["modifier_phrase"] != "default") & (df["target_group"] == item)),
-            "modifier_phrase",
-        ].str.cat(sep=", ")
-
-        if modifiers != "":
-            modifier_groups = df.loc[df["target_group"] == item, "modifier_group"]
-
-            # Lexical targets in abnormal list can either be normal or abnormal
-            normals = ["normal", "absent"]
-            normal_modifier_group = [
-                "normal" for item in list(modifier_groups) if item in normals
-            ]
-            abnormals = ["abnormal", "present", "suspected", "indeterminate"]
-            abnormal_modifier_group = [
-                "abnormal" for item in list(modifier_groups) if item in abnormals
-            ]
-
-            if len(abnormal_modifier_group) == 0 and len(normal_modifier_group) > 0:
-
-                # If "abnormal" not present and "normal" present, then mark item as "normal" in df
-                df.loc[(df["target_group"] == item), "modifier_group"] = "normal"
-                df.loc[(df["target_group"] == item), "modifier_phrase"] = modifiers
-
-            elif len(abnormal_modifier_group) > 0:
-
-                # If "abnormal" present, then mark item as "abnormal" in df
-                df.loc[(df["target_group"] == item), "modifier_group"] = "abnormal"
-                df.loc[(df["target_group"] == item), "modifier_phrase"] = modifiers
-
-    # Change modifier group for present/suspected/indeterminate/absent annotations
-    for item in [
-        item
-        for item in target_list
-        if item not in ["cistern", "gray_white_differentiation"]
-    ]:
+    Args:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase; the target group
+            and modifier group are also returned.
 
-        # Find where item is not default modified
-        modifiers = df.loc[
-            ((df["modifier_phrase"] != "default") & (df["target_group"] == item)),
-            "modifier_phrase",
-        ].str.cat(sep=", ")
-
-        if modifiers != "":
-            modifier_group = df.loc[df["target_group"] == item, "modifier_group"]
-
-            if "abnormal" in list(modifier_group):
-
-                # If 'abnormal' in modifier types, change to 'present'
-                df.loc[
-                    (
-                        (df["target_group"] == item)
-                        & (df["modifier_group"] == "abnormal")
-                    ),
-                    "modifier_group",
-                ] = "present"
-
-                df.loc[
-                    (
-                        (df["target_group"] == item)
-                        & (df["modifier_group"] == "abnormal")
-                    ),
-                    "modifier_phrase",
-                ] = modifiers
-
-            if "normal" in list(modifier_group):
-
-                # If 'normal' in modifier types, change to 'absent'
-                df.loc[
-                    ((df["target_group"] == item) & (df["modifier_group"] == "normal")),
-                    "modifier_group",
-                ] = "absent"
-
-                df.loc[
-                    (
-                        (df["target_group"] == item)
-                        & (df["modifier_group"] == "abnormal")
-                    ),
-                    "modifier_phrase",
-                ] = modifiers
+    Returns:
+        groups (dict): numpy.ndarray of the row positions for each target group.
 
-    return df
+    """
+    return df.groupby("target_group", sort=False, observed=True).indices
 
 
-def is_specific_hemorrhage(df):
-    """If a specific hemorrhage present or suspected,
-    then hemorrhage NOS changed to absent."""
+def rows_of(groups, target_groups):
+    """Row positions of the target groups; empty if none are in the report."""
 
-    hemorrhages = [
-        "epidural_hemorrhage",
-        "subarachnoid_hemorrhage",
-        "subdural_hemorrhage",
+    rows = [groups[group] for group in target_groups if group in groups]
+
+    if not rows:
+        return np.array([], dtype=np.intp)
+
+    return np.concatenate(rows)
+
+
+def set_annotation(df, rows, modifier_group, modifier_phrase):
+    """Set the modifier group and modifier phrase of the rows in one write."""
+
+    columns = [
+        df.columns.get_loc("modifier_group"),
+        df.columns.get_loc("modifier_phrase"),
     ]
-    present = ["present", "suspected"]
+    df.iloc[rows, columns] = [modifier_group, modifier_phrase]
 
-    specific_hemorrhage = len(
-        df.loc[
-            (
-                (df["target_group"].isin(hemorrhages))
-                & (df["modifier_group"].isin(present))
-            )
-        ]
-    )
 
-    modifiers = df.loc[
-        ((df["target_group"] == "hemorrhage")), "modifier_phrase"
-    ].str.cat(sep=", ")
+def derive_targets(df, groups):
+    """Derive the hemorrhage NOS, extraaxial fluid collection, and intracranial
+    pathology annotations from the annotations of the specific targets.
 
-    if (specific_hemorrhage > 0) and (len(df["target_group"].isin(["hemorrhage"])) > 0):
+    If a specific hemorrhage present or suspected, then hemorrhage NOS changed
+    to absent. If hemorrhage present, fluid present; if hemorrhage suspected,
+    fluid suspected if previously default. If specific pathology present,
+    including the derived fluid, then intracranial pathology changed to present.
 
-        df.loc[(df["target_group"] == "hemorrhage"), "modifier_group"] = "absent"
-        df.loc[(df["target_group"] == "hemorrhage"), "modifier_phrase"] = (
-            modifiers + ", is_specific_hemorrhage"
-        )
+    Args:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase; the target group
+            and modifier group are also returned.
 
-    return df
+        groups (dict): numpy.ndarray of the row positions for each target group.
 
+    Returns:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase; the target group
+            and modifier group are also returned.
 
-def is_extraaxial_fluid_collection(df):
-    """If hemorrhage present, fluid present; if hemorrhage suspected,
-    fluid suspected if previously default."""
+    """
+    # Nothing to derive without any of the derived targets
+    if groups.keys().isdisjoint(["hemorrhage", "fluid", "intracranial_pathology"]):
+        return df
 
-    hemorrhages = [
-        "epidural_hemorrhage",
-        "subarachnoid_hemorrhage",
-        "subdural_hemorrhage",
-    ]
+    modifier_groups = df["modifier_group"].to_numpy()
+    modifier_phrases = df["modifier_phrase"].to_numpy()
 
-    specific_hemorrhage = df.loc[(df["target_group"].isin(hemorrhages))]
-    modifiers = df.loc[(df["target_group"] == "fluid"), "modifier_phrase"].str.cat(
-        sep=", "
+    specific_hemorrhage = set(
+        modifier_groups[rows_of(groups, SPECIFIC_HEMORRHAGES)].tolist()
     )
 
-    if "present" in specific_hemorrhage["modifier_group"].tolist():
+    # Derived modifier group and rule of each changed target
+    derived = {}
 
-        # If any hemorrhage "present", then fluid is "present"
-        df.loc[(df["target_group"] == "fluid"), "modifier_group"] = "present"
-        df.loc[(df["target_group"] == "fluid"), "modifier_phrase"] = (
-            modifiers + ", is_extraaxial_fluid_collection"
-        )
-
-    elif ("suspected" in specific_hemorrhage["modifier_group"].tolist()) and (
-        "present" not in specific_hemorrhage["modifier_group"].tolist()
+    if "hemorrhage" in groups and not specific_hemorrhage.isdisjoint(
+        HEMORRHAGE_PRESENT_GROUPS
     ):
+        derived["hemorrhage"] = ("absent", "is_specific_hemorrhage")
 
-        # If any hemorrhage "suspected" and not "present", then fluid "suspected", if fluid "default"
-        is_default = df.loc[
-            ((df["modifier_phrase"] == "default") & (df["target_group"] == "fluid"))
-        ]
+    if "fluid" in groups:
 
-        if len(is_default) > 0:
+        if "present" in specific_hemorrhage:
 
-            df.loc[(df["target_group"] == "fluid"), "modifier_group"] = "suspected"
-            df.loc[(df["target_group"] == "fluid"), "modifier_phrase"] = (
-                modifiers + ", is_extraaxial_fluid_collection"
-            )
+            # If any hemorrhage "present", then fluid is "present"
+            derived["fluid"] = ("present", "is_extraaxial_fluid_collection")
 
-    # Otherwise, fluid is left as original target/modifier pair from algorithm
+        elif "suspected" in specific_hemorrhage:
 
-    return df
+            # If any hemorrhage "suspected" and not "present", then fluid "suspected", if fluid "default"
+            is_default = modifier_phrases[groups["fluid"]] == "default"
 
+            if is_default.any():
+                derived["fluid"] = ("suspected", "is_extraaxial_fluid_collection")
 
-def is_intracranial_pathology(df):
-    """If specific pathology present, change modifier group to present
-    for intracranial pathology target."""
+        # Otherwise, fluid is left as original target/modifier pair from algorithm
 
-    pathology = [
-        "gray_white_differentiation",
-        "cistern",
-        "hydrocephalus",
-        "pneumocephalus",
-        "midline_shift",
-        "mass_effect",
-        "diffuse_axonal",
-        "anoxic",
-        "herniation",
-        "aneurysm",
-        "contusion",
-        "fluid",
-        "swelling",
-        "ischemia",
-        "hemorrhage",
-        "intraventricular_hemorrhage",
-        "intraparenchymal_hemorrage",
-    ]
-
-    present = ["present", "suspected", "abnormal"]
+    if "intracranial_pathology" in groups:
 
-    modifiers = df.loc[
-        (df["target_group"] == "intracranial_pathology"), "modifier_phrase"
-    ].str.cat(sep=", ")
+        path_modifier = modifier_phrases[groups["intracranial_pathology"]].tolist()
 
-    specific_pathology = df.loc[
-        ((df["target_group"].isin(pathology)) & (df["modifier_group"].isin(present)))
-    ]
+        # The pathologies include hemorrhage NOS and fluid, so their derived
+        # modifier groups are used in place of the annotated ones
+        pathology_groups = set()
+        for target in PATHOLOGY_TARGETS.intersection(groups):
+            if target in derived:
+                pathology_groups.add(derived[target][0])
+            else:
+                pathology_groups.update(modifier_groups[groups[target]].tolist())
 
-    path_modifier = df.loc[
-        (df["target_group"] == "intracranial_pathology"), "modifier_phrase"
-    ].tolist()
+        specific_pathology = not pathology_groups.isdisjoint(PATHOLOGY_PRESENT_GROUPS)
 
-    if (len(specific_pathology) > 0) and ("no" not in str(path_modifier)):
+        if specific_pathology and ("no" not in str(path_modifier)):
+            derived["intracranial_pathology"] = ("present", "is_intracranial_pathology")
 
-        df.loc[
-            (df["target_group"] == "intracranial_pathology"), "modifier_group"
-        ] = "present"
-        df.loc[(df["target_group"] == "intracranial_pathology"), "modifier_phrase"] = (
-            modifiers + ", is_intracranial_pathology"
-        )
+    # Apply the derived annotations, noting the rule in the modifier phrase
+    for target, (modifier_group, rule) in derived.items():
+        rows = groups[target]
+        modifiers = ", ".join(modifier_phrases[rows].tolist())
+        set_annotation(df, rows, modifier_group, f"{modifiers}, {rule}")
 
     return df
@@ -1,5 +1,7 @@
 """Sentence markup followed by span, modifier, and distance pruning."""
+import functools
 import logging
+import re
 
 import numpy as np
 import pandas as pd
@@ -68,18 +70,39 @@ def annotate_sentence(targets, modifiers, doc):
     # Create the pyConText instance for the report
     context = pyConText.ConTextDocument()
 
-    # Split the report into individual sentences
-    sentences = [sent.text.strip() for sent in doc.sents]
-
-    # For the report, markup sentences, with span and modifier pruning, and add markup to context
-    for s in sentences:
-        markup = markup_sentence(targets, modifiers, s.lower())
-        context.addMarkup(markup)
+    # Combined lexical target and lexical modifier regular expressions,
+    # compiled once per target set and modifier set
+    target_regex = compile_item_regex(item_regexes(targets))
+    modifier_regex = compile_item_regex(item_regexes(modifiers))
+
+    # Lowercase the report once; sentences are sliced from it by character offset,
+    # unless lowercasing changed the length of the (non-ASCII) text
+    report = doc.text.lower()
+    is_aligned = len(report) == len(doc.text)
+
+    # For the report, markup sentences, with span and modifier pruning, and add markup to context;
+    # sentences are taken directly from the spaCy sentence iterator
+    for sent in doc.sents:
+        if is_aligned:
+            sentence = report[sent.start_char : sent.end_char].strip()
+        else:
+            sentence = sent.text.strip().lower()
+
+        markup = markup_sentence(
+            targets, modifiers, sentence, target_regex, modifier_regex
+        )
+
+        # A markup without target/modifier relations adds no annotations, but
+        # would still be copied into the document graph
+        if markup.number_of_edges() > 0:
+            context.addMarkup(markup)
 
     return context
 
 
-def markup_sentence(targets, modifiers, sentence):
+def markup_sentence(
+    targets, modifiers, sentence, target_regex=None, modifier_regex=None
+):
     """Markup sentence with lexical targets and lexical modifiers.
 
     Args:
@@ -93,6 +116,12 @@ def markup_sentence(targets, modifiers, sentence):
 
         sentence (str): a string representing one sentence of a report.
 
+        target_regex (re.Pattern): combined regular expression of the lexical
+            targets; if given, sentences without a match are not marked up.
+
+        modifier_regex (re.Pattern): combined regular expression of the lexical
+            modifiers; if given, sentences without a match are not marked up.
+
     Returns:
         markup (pyConTextNLP.pyConTextGraph.ConTextMarkup): object containing
             sentence markups across the sentence understood as a digraph  of the
@@ -108,6 +137,15 @@ def markup_sentence(targets, modifiers, sentence):
     # Strip non alphanumeric and clean whitespace
     markup.cleanText()
 
+    # Without a lexical target, every modifier would be dropped as inactive,
+    # and without a lexical modifier, no target would be modified; in either
+    # case, the sentence adds no relations, so skip marking it up entirely
+    text = markup.getText()
+    if target_regex is not None and not target_regex.search(text):
+        return markup
+    if modifier_regex is not None and not modifier_regex.search(text):
+        return markup
+
     # Markup text
     markup.markItems(modifiers, mode="modifier")
     markup.markItems(targets, mode="target")
@@ -126,6 +164,23 @@ def markup_sentence(targets, modifiers, sentence):
     return markup
 
 
+def item_regexes(items):
+    """Regular expressions of the lexical items, as matched by pyConTextNLP;
+    an item without a regular expression is matched on its literal."""
+
+    return tuple(item.getRE() or r"\b{}\b".format(item.getLiteral()) for item in items)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_item_regex(regexes):
+    """Compile lexical item regular expressions into a single alternation;
+    it matches a sentence if, and only if, one of the lexical items does."""
+
+    return re.compile(
+        "|".join(f"(?:{regex})" for regex in regexes), re.IGNORECASE | re.UNICODE
+    )
+
+
 def distance_pruning(context):
     """Prune sentence annotations based on nearest character distance of a
         lexical modifer to lexical target, resulting in one modifier per target.
@@ -141,105 +196,84 @@ def distance_pruning(context):
             and modifier group are also returned.
 
     """
-    # Setup dataframe to store results
+    # Setup rows to store results; the dataframe is built once at the end
     output_columns = [
         "target_phrase",
         "target_group",
         "modifier_phrase",
         "modifier_group",
     ]
-    df = pd.DataFrame(columns=output_columns)
+    rows = []
 
     # Get graph of document with markups
     g = context.getDocumentGraph()
 
-    for idx, node in enumerate(g.nodes()):
+    for node in g.nodes():
 
-        target_phrase = node.getPhrase()
-        target_group = node.categoryString()
         is_type = node.getConTextCategory()  # is target or is modifier
 
+        # Skip modifier type nodes; focused on pruning in relation to targets
+        if is_type == "modifier":
+            continue
+
         # Sanity check: only targets should have predecessors; modifiers can
         # be modified and therefore have both predecessors and successors
-        if (is_type == "target") and (len(list(g.successors(node))) > 0):
+        if g.out_degree(node) > 0:
             log.critical("Lexical target has successors.")
 
-        # Skip modifier type nodes; focused on pruning in relation to targets
-        if is_type == "modifier":
+        target_phrase = node.getPhrase()
+        target_group = node.categoryString()
+
+        preds = list(g.predecessors(node))
+
+        # A lexical target was found with no available lexical modifiers in the sentence
+        if not preds:
             continue
 
         # find nearest modifier for target with multiple modifiers in one sentence
-        try:
-            if len(list(g.predecessors(node))) > 1:
-
-                target_span = node.getSpan()
-                distance_columns = output_columns + ["left_diff", "right_diff"]
-                modifier_distances = pd.DataFrame(columns=distance_columns)
-
-                for i in range(len(list(g.predecessors(node)))):
-
-                    modifier_dist = pd.DataFrame(columns=distance_columns)
-                    modifier_span = list(g.predecessors(node))[i].getSpan()
-                    left_diff = target_span[0] - modifier_span[1]
-                    right_diff = modifier_span[0] - target_span[1]
-
-                    # if left or right difference negative, then the modifier is not on that side
-                    if left_diff < 0:
-                        left_diff = np.nan
-
-                    if right_diff < 0:
-                        right_diff = np.nan
-
-                    modifier_phrase = list(g.predecessors(node))[i].getPhrase()
-                    modifier_group = list(g.predecessors(node))[i].categoryString()
-
-                    data = [
-                        [
-                            target_phrase,
-                            target_group,
-                            modifier_phrase,
-                            modifier_group,
-                            left_diff,
-                            right_diff,
-                        ]
-                    ]
-                    modifier_dist = pd.DataFrame(data, columns=distance_columns)
-                    # modifier_distances = modifier_distances.append(modifier_dist)
-                    modifier_distances = pd.concat([modifier_distances, modifier_dist])
-
-                if modifier_distances[["left_diff", "right_diff"]].isna().all().all():
-                    # Unable to establish distance, keep all modifiers identified
-                    nearest_modifier = modifier_distances[output_columns]
-                else:
-                    min_diff = np.nanmin(
-                        [
-                            modifier_distances["left_diff"].min(),
-                            modifier_distances["right_diff"].min(),
-                        ]
-                    )
-                    nearest_modifier = modifier_distances.loc[
-                        (
-                            (modifier_distances["left_diff"] == min_diff)
-                            | (modifier_distances["right_diff"] == min_diff)
-                        )
-                    ]
-                    nearest_modifier = nearest_modifier[output_columns]
+        if len(preds) > 1:
 
-            else:
-                modifier_phrase = list(g.predecessors(node))[0].getPhrase()
-                modifier_group = list(g.predecessors(node))[0].categoryString()
-                data = [[target_phrase, target_group, modifier_phrase, modifier_group]]
-                nearest_modifier = pd.DataFrame(data, columns=output_columns)
+            target_span = node.getSpan()
+            modifier_spans = np.array([pred.getSpan() for pred in preds], dtype=float)
+            left_diffs = target_span[0] - modifier_spans[:, 1]
+            right_diffs = modifier_spans[:, 0] - target_span[1]
 
-        except IndexError:
-            # A lexical target was found with no available lexical modifiers in the sentence
-            continue
+            # if left or right difference negative, then the modifier is not on that side
+            left_diffs = np.where(left_diffs < 0, np.nan, left_diffs)
+            right_diffs = np.where(right_diffs < 0, np.nan, right_diffs)
 
-        # add target and modifier, and their respective group, to dataframe
-        # df = df.append(nearest_modifier, ignore_index=True)
-        df = pd.concat([df, nearest_modifier])
+            # nearest side of each modifier, and nearest of all modifiers;
+            # fmin only returns nan where no distance is established
+            diffs = np.fmin(left_diffs, right_diffs)
+            min_diff = np.fmin.reduce(diffs)
 
-    # drop duplicate rows
-    df.drop_duplicates(keep="first", inplace=True)
+            if np.isnan(min_diff):
+                # Unable to establish distance, keep all modifiers identified
+                is_nearest = np.ones(len(preds), dtype=bool)
+            else:
+                is_nearest = diffs == min_diff
+
+            nearest_modifier = [
+                (target_phrase, target_group, pred.getPhrase(), pred.categoryString())
+                for pred, nearest in zip(preds, is_nearest)
+                if nearest
+            ]
+
+        else:
+            modifier_phrase = preds[0].getPhrase()
+            modifier_group = preds[0].categoryString()
+            nearest_modifier = [
+                (target_phrase, target_group, modifier_phrase, modifier_group)
+            ]
+
+        # add target and modifier, and their respective group, to results
+        rows.extend(nearest_modifier)
+
+    # drop duplicate rows, keeping the first occurrence, before building the dataframe
+    rows = list(dict.fromkeys(rows))
+
+    # rows are tuples of strings, so they are taken as records without inference
+    # of nested sequences; the group columns are made categorical on report markup
+    df = pd.DataFrame.from_records(rows, columns=output_columns)
 
     return df
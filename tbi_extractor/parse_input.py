@@ -1,22 +1,33 @@
 """Parse inputs to set configuration for tbiExtractor algorithm."""
 
+import functools
 import logging
 import os
-import pkg_resources
 
-import spacy
 import pyConTextNLP.itemData as itemData
 
-
 log = logging.getLogger(__name__)
 
 
-targets_file = pkg_resources.resource_filename(__name__, "data/lexical_targets.tsv")
-modifiers_file = pkg_resources.resource_filename(__name__, "data/lexical_modifiers.tsv")
+data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+targets_file = os.path.join(data_path, "lexical_targets.tsv")
+modifiers_file = os.path.join(data_path, "lexical_modifiers.tsv")
+
+# spaCy model used to split reports into sentences; None uses a blank English
+# pipeline with the rule-based sentencizer, e.g. set to "en_core_sci_md" to use
+# the dependency parser of a trained model instead; read on the first load
+SPACY_MODEL = None
+
+# Types accepted as include or exclude lists of lexical targets
+COLLECTIONS = (list, tuple, set, frozenset)
+
+# Components of a trained model needed for sentence boundaries; they are kept
+# on load, together with any shared embedding component they listen to, e.g.
+# tok2vec or transformer; any other component of the model is disabled
+REQUIRED_COMPONENTS = frozenset({"parser", "senter", "sentencizer"})
 
 
 def run(
-    # report_file,
     TARGETS,
     include_targets=None,
     exclude_targets=None,
@@ -24,10 +35,8 @@ def run(
     """Run the parsing of inputs to set the objects required for tbiExtractor.
 
     Args:
-        report_file (pathlib.PosixPath): Path to the .txt file
-            containing the radiology report.
-
-        TARGETS (list): Default list of lexical targets.
+        TARGETS (frozenset): Default set of lexical targets; a list or tuple
+            is also accepted.
 
         >>>>> Can only set to include or exclude lexical target options to limit
                 the search. Defaults to standard target list.
@@ -39,6 +48,9 @@ def run(
             exclude. Default: None, resulting in standard target list output.
 
     Returns:
+        specified_targets (list): unique list of target phrases used for annotation,
+            sorted.
+
         targets (pyConTextNLP.itemData.itemData): itemData stores a literal,
             category, regular expression, and rule of the targets extracted
             from the targets_file input.
@@ -47,48 +59,157 @@ def run(
             category, regular expression, and rule of the modifiers extracted
             from the modifiers_file input.
 
-        doc (spacy.tokens.doc.Doc): spaCy Document containing the radiology
-            report.
-
     """
-    # Load lexical targets and lexical modifiers as itemData
-    targets = itemData.instantiateFromCSVtoitemData(f"file:{targets_file}")
-    modifiers = itemData.instantiateFromCSVtoitemData(f"file:{modifiers_file}")
-
-    exclude_targets = ["anoxic"]
+    # The standard target list leaves out anoxic; an include or exclude list
+    # given by the caller is used as is
+    if include_targets is None and exclude_targets is None:
+        exclude_targets = ["anoxic"]
 
     # From include and exclude lists, determine algorithm targets
     specified_targets = alter_default_input(
         TARGETS, include=include_targets, exclude=exclude_targets
     )
 
-    print(f">>> There are {len(specified_targets)} specified targets.")
+    log.debug("There are %d specified targets.", len(specified_targets))
 
-    # Remove lexical targets from investigation set
-    targets = [x for x in targets if x.categoryString() in specified_targets]
+    # Sorted, so the specified targets have the same order across runs
+    specified_targets = tuple(sorted(specified_targets))
 
-    # # Load spacy model
-    # print(f'>>> Loading spacy model...')
-    # nlp = spacy.load("en_core_sci_md")
-    # print(f'>>> ... loaded.')
+    # Lexical targets and lexical modifiers for the specified targets
+    targets, modifiers = load_resources(specified_targets)
 
-    # from pathlib import Path
+    return list(specified_targets), targets, modifiers
 
-    # # Load the radiology report from file
-    # if report_file.is_file():
 
-    #     with open(report_file, "r") as report_obj:
-    #         report = report_obj.read().replace("\n", "")
+def load_resources(specified_targets):
+    """Load the lexical resources of tbiExtractor for a set of specified targets.
 
-    # else:
-    #     log.error("Unable to establish pathway to report file.")
-    #     os.sys.exit(1)
+    Args:
+        specified_targets (tuple): sorted target phrases used for annotation.
 
-    # Convert report to spacy container
-    # doc = nlp(report)
+    Returns:
+        targets (list): pyConTextNLP.itemData.itemData of the lexical targets
+            in the specified targets.
+
+        modifiers (pyConTextNLP.itemData.itemData): itemData stores a literal,
+            category, regular expression, and rule of the modifiers extracted
+            from the modifiers_file input.
+
+    """
+    # Remove lexical targets from investigation set; a new list, so the
+    # cached itemData is left unchanged
+    targets = [x for x in load_targets() if x.categoryString() in specified_targets]
+
+    return targets, load_modifiers()
+
+
+@functools.lru_cache(maxsize=1)
+def load_targets():
+    """Load the lexical targets as itemData; parsed once and reused by later calls."""
+    return itemData.instantiateFromCSVtoitemData(f"file:{targets_file}")
+
+
+@functools.lru_cache(maxsize=1)
+def load_modifiers():
+    """Load the lexical modifiers as itemData; parsed once and reused by later calls."""
+    return itemData.instantiateFromCSVtoitemData(f"file:{modifiers_file}")
+
+
+@functools.lru_cache(maxsize=1)
+def load_nlp():
+    """Load the spaCy model used to split radiology reports into sentences.
+
+    Only sentence boundaries are used downstream, so by default a blank
+    pipeline with the rule-based sentencizer is used; if SPACY_MODEL is set,
+    that model is loaded with only the components needed for sentence
+    boundaries enabled. The model is loaded once and reused by later calls.
+
+    Returns:
+        nlp (spacy.language.Language): spaCy pipeline for the reports.
+
+    """
+    # spaCy is imported on the first load, so that e.g. the command line help
+    # does not wait on it
+    import spacy
+
+    if SPACY_MODEL is None:
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+
+    else:
+        log.debug("Loading spacy model %s...", SPACY_MODEL)
+        nlp = spacy.load(SPACY_MODEL)
+        nlp.select_pipes(disable=unused_components(nlp))
+        log.debug("... loaded.")
+
+        # Without a parser or sentencizer of the model, sentence boundaries
+        # come from an added sentencizer
+        if not any(nlp.has_pipe(name) for name in REQUIRED_COMPONENTS):
+            nlp.add_pipe("sentencizer")
+
+    return nlp
 
-    # return list(specified_targets), targets, modifiers, doc
-    return list(specified_targets), targets, modifiers
+
+def unused_components(nlp):
+    """Components of a spaCy pipeline that are not needed for sentence boundaries.
+
+    Args:
+        nlp (spacy.language.Language): spaCy pipeline of a trained model.
+
+    Returns:
+        names (list): names of the components to disable.
+
+    """
+    required = REQUIRED_COMPONENTS.intersection(nlp.pipe_names)
+
+    # Shared embedding components, e.g. tok2vec or transformer, are needed if
+    # a required component listens to them
+    listened = {
+        name
+        for name, component in nlp.pipeline
+        if not required.isdisjoint(getattr(component, "listening_components", ()))
+    }
+
+    return [name for name in nlp.pipe_names if name not in required | listened]
+
+
+def parse_reports(reports, batch_size=64, n_process=1):
+    """Convert radiology reports to spaCy containers, in batches.
+
+    Args:
+        reports (list): text of each radiology report.
+
+        batch_size (int): Number of reports buffered by spaCy per batch.
+
+        n_process (int): Number of processes used by spaCy; -1 uses all CPUs.
+
+    Returns:
+        docs (generator): spaCy Document containing each radiology report,
+            in the order of the reports.
+
+    """
+    nlp = load_nlp()
+
+    return nlp.pipe(reports, batch_size=batch_size, n_process=n_process)
+
+
+def load_report(report_file):
+    """Load the radiology report from file.
+
+    Args:
+        report_file (pathlib.PosixPath): Path to the .txt file
+            containing the radiology report.
+
+    Returns:
+        report (str): text of the radiology report.
+
+    """
+    # Read in one call, rather than checking the path and then opening it;
+    # bytes that are not UTF-8, e.g. from a latin-1 report, are replaced, so
+    # one report does not stop a batch
+    report = report_file.read_text(encoding="utf-8", errors="replace")
+
+    return report.replace("\n", " ")
 
 
 def alter_default_input(DEFAULT, include=None, exclude=None):
@@ -97,14 +218,16 @@ def alter_default_input(DEFAULT, include=None, exclude=None):
     Defaults to set of the DEFAULT input list.
 
     """
-    if isinstance(include, list) and exclude is None:
+    # A frozenset DEFAULT is used as is, rather than copied
+    default_standard = frozenset(DEFAULT)
+
+    if isinstance(include, COLLECTIONS) and exclude is None:
 
         to_include = set(include)
-        default_standard = set(DEFAULT)
 
-        print(f">>> to_include: {to_include}")
+        log.debug("to_include: %s", to_include)
 
-        output = set.intersection(to_include, default_standard)
+        output = default_standard.intersection(to_include)
 
         if to_include != output:
             ignored = set.difference(to_include, output)
@@ -113,19 +236,16 @@ def alter_default_input(DEFAULT, include=None, exclude=None):
             )
             log.info(f"The following include items were not considered: {ignored}.")
 
-    elif isinstance(exclude, list) and include is None:
+    elif isinstance(exclude, COLLECTIONS) and include is None:
 
         to_exclude = set(exclude)
-        default_standard = set(DEFAULT)
-        
-        print(f">>> to_exclude: {to_exclude}")
-        
-        output = set.difference(default_standard, to_exclude)
-
-        if to_exclude != set.difference(default_standard, output):
-            ignored = set.difference(
-                to_exclude, set.difference(default_standard, output)
-            )
+
+        log.debug("to_exclude: %s", to_exclude)
+
+        output = default_standard.difference(to_exclude)
+
+        if to_exclude != default_standard.difference(output):
+            ignored = to_exclude.difference(default_standard.difference(output))
             log.info(
                 f"Expects a list of a subset of the available options to exclude: {DEFAULT}."
             )
@@ -133,11 +253,11 @@ def alter_default_input(DEFAULT, include=None, exclude=None):
 
     elif include is None and exclude is None:
 
-        output = set(DEFAULT)
+        output = default_standard
 
     else:
         log.critical("You can only provide a list to include or exclude.")
-        os.sys.exit(1)
+        raise SystemExit(1)
 
     if len(output) < 1:
         log.critical(
@@ -145,6 +265,6 @@ def alter_default_input(DEFAULT, include=None, exclude=None):
             "options in the default list. Please read the documentation "
             "for details."
         )
-        os.sys.exit(1)
+        raise SystemExit(1)
 
     return output
@@ -2,20 +2,24 @@
 """Main script for tbiExtractor."""
 
 import argparse
+import itertools
 import logging
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
 
+import pandas as pd
+
 import parse_input
 import annotate_sentences
 import annotate_report
 
-
 FORMAT = "[%(asctime)s - %(levelname)s - %(name)s:%(lineno)d] %(message)s"
-logging.basicConfig(level=logging.INFO, format=FORMAT, datefmt="%Y-%m-%d")
-log = logging.getLogger()
+log = logging.getLogger(__name__)
 
-TARGETS = [
+TARGETS = (
     # "aneurysm",
     "anoxic",
     # "atrophy",
@@ -43,7 +47,8 @@ TARGETS = [
     "skull_fracture",
     "sah",
     "sdh",
-]
+)
+TARGETS_SET = frozenset(TARGETS)
 
 
 def run(
@@ -56,7 +61,8 @@ def run(
     """Orchestrate tbiExtractor.
 
     Args:
-        report_file (str): Path to the .txt file containing the radiology report.
+        report_file (str or pathlib.Path): Path to the .txt file containing the
+            radiology report.
 
         save_target_phrases (bool):  If True, save the lexical target phrases
             identified in the report for the resulting annotation.
@@ -79,45 +85,351 @@ def run(
             default includes the target group and modifier group.
 
     """
-    # Set input for tbiExtractor algorithm
-    specified_targets, targets, modifiers, doc = parse_input.run(
-        Path(report_file),
-        TARGETS,
-        include_targets,
-        exclude_targets,
+    df = run_batch(
+        [report_file],
+        save_target_phrases=save_target_phrases,
+        save_modifier_phrases=save_modifier_phrases,
+        include_targets=include_targets,
+        exclude_targets=exclude_targets,
+    )
+
+    # Output annotated report as dataframe, without the report file column
+    return df[output_columns(save_target_phrases, save_modifier_phrases)]
+
+
+def run_batch(
+    report_files,
+    save_target_phrases=False,
+    save_modifier_phrases=False,
+    include_targets=None,
+    exclude_targets=None,
+    batch_size=64,
+    n_process=1,
+    workers=1,
+):
+    """Orchestrate tbiExtractor for a batch of radiology reports.
+
+    The spaCy model is loaded once and the reports are streamed through
+    nlp.pipe, rather than calling the pipeline once per report; identical
+    reports are only annotated once.
+
+    Args:
+        report_files (iterable): Paths to the .txt files containing the radiology
+            reports.
+
+        save_target_phrases (bool):  If True, save the lexical target phrases
+            identified in the report for the resulting annotation.
+
+        save_modifier_phrases (bool): If True, save the lexical modifier phrases
+            identified in the report for the resulting annotation.
+
+        >>>>> Can only set to include or exclude lexical target options to limit
+                the search. Defaults to standard target list.
+
+        include_targets (list): A subset of the available lexical targets options to
+            include. Default: None, resulting in standard target list output.
+
+        exclude_targets (list): A subset of the available lexical targets options to
+            exclude. Default: None, resulting in standard target list output.
+
+        batch_size (int): Number of reports buffered by spaCy per batch.
+
+        n_process (int): Number of processes used by spaCy; -1 uses all CPUs.
+
+        workers (int): Number of processes used to parse and annotate the
+            reports; None uses all CPUs. Default: 1, annotating in the current
+            process, with the reports parsed by spaCy in batches.
+
+    Returns:
+        df (pandas.core.frame.DataFrame): dataframe containing, for each report
+            file, each identified target phrase with its associated modifer
+            phrase, if indicated in arguments; default includes the report file,
+            target group and modifier group.
+
+    """
+    # Report files are read and labelled from the same list, so any iterable
+    # is taken once
+    report_files = list(report_files)
+
+    # Set input for tbiExtractor algorithm; frozensets, so the input is set once
+    # per include/exclude targets
+    include_targets = None if include_targets is None else frozenset(include_targets)
+    exclude_targets = None if exclude_targets is None else frozenset(exclude_targets)
+    specified_targets, targets, modifiers = specialize_targets(
+        include_targets, exclude_targets
+    )
+    log.debug("Parsed input")
+
+    # Without reports, the output has the columns only
+    if not report_files:
+        return pd.DataFrame(
+            columns=["report_file"]
+            + output_columns(save_target_phrases, save_modifier_phrases)
+        )
+
+    # Each report is read once, as text; files are read in threads, as reading
+    # is bound by I/O rather than by the interpreter
+    with ThreadPoolExecutor() as executor:
+        texts = executor.map(
+            parse_input.load_report, [Path(report_file) for report_file in report_files]
+        )
+        reports = list(zip(texts, report_files))
+
+    # Identical reports are parsed and annotated only once
+    texts = list(dict.fromkeys(report for report, _ in reports))
+
+    # Reports are independent, so the annotation can be spread across processes
+    if workers == 1:
+        docs = parse_input.parse_reports(
+            texts, batch_size=batch_size, n_process=n_process
+        )
+        annotate = partial(
+            annotate_doc,
+            specified_targets=specified_targets,
+            targets=targets,
+            modifiers=modifiers,
+            save_target_phrases=save_target_phrases,
+            save_modifier_phrases=save_modifier_phrases,
+        )
+        annotated = dict(zip(texts, map(annotate, docs)))
+
+    else:
+        # Each worker sets up the spaCy pipeline and lexical resources once, so
+        # only the report texts and include/exclude targets are sent, in chunks;
+        # a parsed Doc would carry its whole Vocab to the worker
+        annotate = partial(
+            annotate_text,
+            include_targets=include_targets,
+            exclude_targets=exclude_targets,
+            save_target_phrases=save_target_phrases,
+            save_modifier_phrases=save_modifier_phrases,
+        )
+        max_workers = workers or os.cpu_count()
+        chunksize = max(1, len(texts) // (4 * max_workers))
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(include_targets, exclude_targets),
+        ) as executor:
+            annotated = dict(
+                zip(texts, executor.map(annotate, texts, chunksize=chunksize))
+            )
+
+    # Label each report's rows with its file in the single concatenation,
+    # rather than copying and inserting a column per report; the rows of each
+    # report are already sorted by target group
+    df = pd.concat(
+        [annotated[report] for report, _ in reports],
+        keys=[str(report_file) for _, report_file in reports],
+        names=["report_file", None],
+    )
+    df = df.reset_index(level="report_file").reset_index(drop=True)
+
+    # Output annotated reports as dataframe
+    return df
+
+
+def run_iter(
+    report_files,
+    save_target_phrases=False,
+    save_modifier_phrases=False,
+    include_targets=None,
+    exclude_targets=None,
+    batch_size=64,
+):
+    """Orchestrate tbiExtractor for a stream of radiology reports, yielding the
+    annotations of each report as rows rather than returning a dataframe.
+
+    Reports are read and parsed lazily, so only the reports in the current
+    spaCy batch are held in memory.
+
+    Args:
+        report_files (iterable): Paths to the .txt files containing the radiology
+            reports.
+
+        save_target_phrases (bool):  If True, save the lexical target phrases
+            identified in the report for the resulting annotation.
+
+        save_modifier_phrases (bool): If True, save the lexical modifier phrases
+            identified in the report for the resulting annotation.
+
+        >>>>> Can only set to include or exclude lexical target options to limit
+                the search. Defaults to standard target list.
+
+        include_targets (list): A subset of the available lexical targets options to
+            include. Default: None, resulting in standard target list output.
+
+        exclude_targets (list): A subset of the available lexical targets options to
+            exclude. Default: None, resulting in standard target list output.
+
+        batch_size (int): Number of reports buffered by spaCy per batch.
+
+    Yields:
+        row (tuple): the report file, followed by the target phrase, if
+            indicated in arguments, target group, modifier phrase, if indicated
+            in arguments, and modifier group; rows of each report are sorted
+            by target group.
+
+    """
+    specified_targets, targets, modifiers = specialize_targets(
+        None if include_targets is None else frozenset(include_targets),
+        None if exclude_targets is None else frozenset(exclude_targets),
+    )
+
+    # Report files are consumed once, alongside their parsed reports
+    report_files, files = itertools.tee(report_files)
+    texts = (parse_input.load_report(Path(report_file)) for report_file in files)
+    docs = parse_input.parse_reports(texts, batch_size=batch_size)
+
+    for report_file, doc in zip(report_files, docs):
+        df = annotate_doc(
+            doc,
+            specified_targets,
+            targets,
+            modifiers,
+            save_target_phrases=save_target_phrases,
+            save_modifier_phrases=save_modifier_phrases,
+        )
+
+        for row in df.itertuples(index=False, name=None):
+            yield (str(report_file),) + row
+
+
+@lru_cache(maxsize=32)
+def specialize_targets(include_targets=None, exclude_targets=None):
+    """Set the input for tbiExtractor once per include/exclude targets, for the
+    life of the process.
+
+    Args:
+        include_targets (frozenset): A subset of the available lexical targets
+            options to include. Default: None, resulting in standard target list.
+
+        exclude_targets (frozenset): A subset of the available lexical targets
+            options to exclude. Default: None, resulting in standard target list.
+
+    Returns:
+        specified_targets, targets, modifiers: as returned by parse_input.run.
+
+    """
+    return parse_input.run(TARGETS_SET, include_targets, exclude_targets)
+
+
+def init_worker(include_targets=None, exclude_targets=None):
+    """Load the spaCy pipeline and set the input for tbiExtractor once per
+    worker process."""
+    parse_input.load_nlp()
+    specialize_targets(include_targets, exclude_targets)
+
+
+def annotate_text(
+    report,
+    include_targets=None,
+    exclude_targets=None,
+    save_target_phrases=False,
+    save_modifier_phrases=False,
+):
+    """Parse and annotate the text of one radiology report with the input set
+    for the include/exclude targets, as in a worker process set up by init_worker."""
+
+    specified_targets, targets, modifiers = specialize_targets(
+        include_targets, exclude_targets
+    )
+
+    return annotate_doc(
+        parse_input.load_nlp()(report),
+        specified_targets,
+        targets,
+        modifiers,
+        save_target_phrases=save_target_phrases,
+        save_modifier_phrases=save_modifier_phrases,
     )
-    print(f'>>> Parsed input')
 
+
+def annotate_doc(
+    doc,
+    specified_targets,
+    targets,
+    modifiers,
+    save_target_phrases=False,
+    save_modifier_phrases=False,
+):
+    """Annotate the sentences and the report of one radiology report.
+
+    Args:
+        doc (spacy.tokens.doc.Doc): spaCy Document containing the radiology
+            report.
+
+        specified_targets (list): unique list of target phrases used for annotation.
+
+        targets (pyConTextNLP.itemData.itemData): itemData stores a literal,
+            category, regular expression, and rule of the targets extracted
+            from the targets_file input.
+
+        modifiers (pyConTextNLP.itemData.itemData): itemData stores a literal,
+            category, regular expression, and rule of the modifiers extracted
+            from the modifiers_file input.
+
+        save_target_phrases (bool):  If True, save the lexical target phrases
+            identified in the report for the resulting annotation.
+
+        save_modifier_phrases (bool): If True, save the lexical modifier phrases
+            identified in the report for the resulting annotation.
+
+    Returns:
+        df (pandas.core.frame.DataFrame): dataframe containing each identified
+            target phrase with its associated modifer phrase, if indicated in arguments;
+            default includes the target group and modifier group.
+
+    """
     # Annotate sentences
     df = annotate_sentences.run(targets, modifiers, doc)
-    print(f'>>> annotated sentences')
+    log.debug("Annotated sentences")
 
-    # Annotate report
-    df = annotate_report.run(df, specified_targets)
-    print(f'>>> annotated report')
+    # Annotate report; polish output, keeping only the requested columns
+    df = annotate_report.run(
+        df,
+        specified_targets,
+        columns=output_columns(save_target_phrases, save_modifier_phrases),
+    )
+    log.debug("Annotated report")
 
-    # Polish output
-    if not save_target_phrases:
-        df.drop(columns="target_phrase", inplace=True)
-    if not save_modifier_phrases:
-        df.drop(columns="modifier_phrase", inplace=True)
+    return df
 
-    df.sort_values("target_group", axis=0, inplace=True)
-    df.reset_index(inplace=True, drop="index")
 
-    # Output annotated report as dataframe
-    return df
+def output_columns(save_target_phrases=False, save_modifier_phrases=False):
+    """Columns of the annotation output, in order, for the phrases to save."""
+
+    columns = ["target_group", "modifier_group"]
+    if save_target_phrases:
+        columns.insert(0, "target_phrase")
+    if save_modifier_phrases:
+        columns.insert(-1, "modifier_phrase")
+
+    return columns
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Run tbiExtractor")
 
-    parser.add_argument(
+    # Can either annotate one report or a batch of reports
+    group_reports = parser.add_mutually_exclusive_group(required=True)
+
+    group_reports.add_argument(
         "--report_file",
-        required=True,
         help="The path to the .txt file containing the radiology report.",
     )
+    group_reports.add_argument(
+        "--report_files",
+        nargs="+",
+        help="The paths to the .txt files containing the radiology reports, annotated as a batch.",
+    )
+    group_reports.add_argument(
+        "--stdin_loop",
+        action="store_true",
+        help="Read the paths to the .txt files containing the radiology reports from stdin, one per line, and print the annotation rows of each, with its report file, as .csv.",
+    )
     parser.add_argument(
         "--save_target_phrases",
         action="store_true",
@@ -138,7 +450,7 @@ if __name__ == "__main__":
     group_targets.add_argument(
         "--include_targets",
         nargs="+",
-        default=TARGETS,
+        default=None,
         help=f"To limit the lexical targets, list a subset of the available options to include: {TARGETS}.",
     )
 
@@ -149,18 +461,105 @@ if __name__ == "__main__":
         help=f"To limit the lexical targets, list a subset of the available options to exclude: {TARGETS}.",
     )
 
+    parser.add_argument(
+        "--output",
+        help="The path to the .csv file to write the annotations to; otherwise, the annotations are printed. With --stdin_loop, the rows of each report are appended as it is annotated.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of processes used to annotate the --report_files; 0 uses all CPUs.",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="Set to log the progress of tbiExtractor.",
+    )
+
     args = parser.parse_args()
 
-    # If the report is not a file, then exit
-    report = Path(args.report_file)
-    if not report.is_file():
-        print("Unable to establish pathway to report file.")
-        os.sys.exit(1)
-
-    run(
-        report_file=args.report_file,
-        save_target_phrases=args.save_target_phrases,
-        save_modifier_phrases=args.save_modifier_phrases,
-        include_targets=args.include_targets,
-        exclude_targets=args.exclude_targets,
-    )
\ No newline at end of file
+    # Logging is only configured when run as a script; progress is logged
+    # with --verbose
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format=FORMAT,
+        datefmt="%Y-%m-%d",
+    )
+
+    # Annotate each report as its path is read; the spaCy pipeline and lexical
+    # resources are loaded on the first report and reused for the others
+    if args.stdin_loop:
+        # Rows carry their report file, so a skipped report leaves no gap; the
+        # header is written once, before the rows of the first report
+        header = True
+
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+
+            report_file = Path(line.strip())
+            if not report_file.is_file():
+                log.error(f"Unable to establish pathway to report file: {report_file}")
+                continue
+
+            # A report that cannot be read or annotated is logged and skipped,
+            # rather than ending the loop
+            try:
+                df = run_batch(
+                    report_files=[report_file],
+                    save_target_phrases=args.save_target_phrases,
+                    save_modifier_phrases=args.save_modifier_phrases,
+                    include_targets=args.include_targets,
+                    exclude_targets=args.exclude_targets,
+                )
+            except Exception:
+                log.exception(f"Unable to annotate report file: {report_file}")
+                continue
+
+            if args.output:
+                df.to_csv(
+                    args.output, mode="w" if header else "a", header=header, index=False
+                )
+            else:
+                print(df.to_csv(header=header, index=False), end="", flush=True)
+
+            header = False
+
+        raise SystemExit(0)
+
+    # If a report is not a file, then exit; the paths are reused for the run
+    report_files = [Path(report_file) for report_file in args.report_files or []]
+    report = Path(args.report_file) if args.report_file else None
+
+    for report_file in report_files or [report]:
+        if not report_file.is_file():
+            raise SystemExit(
+                f"Unable to establish pathway to report file: {report_file}"
+            )
+
+    if args.report_files:
+        df = run_batch(
+            report_files=report_files,
+            workers=args.workers or None,
+            save_target_phrases=args.save_target_phrases,
+            save_modifier_phrases=args.save_modifier_phrases,
+            include_targets=args.include_targets,
+            exclude_targets=args.exclude_targets,
+        )
+
+    else:
+        df = run(
+            report_file=report,
+            save_target_phrases=args.save_target_phrases,
+            save_modifier_phrases=args.save_modifier_phrases,
+            include_targets=args.include_targets,
+            exclude_targets=args.exclude_targets,
+        )
+
+    # Write the annotations, if a path is given, otherwise print them
+    if args.output:
+        df.to_csv(args.output, index=False)
+    else:
+        print(df.to_string(index=False))
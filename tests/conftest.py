@@ -0,0 +1,10 @@
+"""Shared configuration for the tbiExtractor tests."""
+
+import os
+import sys
+
+# The tbiExtractor modules import each other by module name, as when run as
+# scripts from the package directory
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tbi_extractor")
+)
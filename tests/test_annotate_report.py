@@ -0,0 +1,216 @@
+"""Tests for the report annotation revisions of tbiExtractor."""
+
+import pandas as pd
+
+import annotate_report
+
+COLUMNS = ["target_phrase", "target_group", "modifier_phrase", "modifier_group"]
+
+
+def make_report(rows, target_list):
+    """Sentence annotations as passed to the report revisions."""
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    return annotate_report.categorize_groups(df, target_list)
+
+
+def annotations(df):
+    """Modifier group of each target group."""
+    return dict(zip(df["target_group"].astype(str), df["modifier_group"].astype(str)))
+
+
+def test_duplicate_targets_majority_vote():
+    df = make_report(
+        [
+            ["sah", "sah", "no", "absent"],
+            ["sah", "sah", "without", "absent"],
+            ["sah", "sah", "with", "present"],
+        ],
+        ["sah"],
+    )
+
+    df = annotate_report.duplicate_targets(df)
+
+    assert df.values.tolist() == [["sah", "sah", "no, without", "absent"]]
+
+
+def test_duplicate_targets_tie_selects_present_first():
+    df = make_report(
+        [
+            ["sdh", "sdh", "no", "absent"],
+            ["sdh", "sdh", "with", "present"],
+            ["sdh", "sdh", "possible", "suspected"],
+            ["subdural", "sdh", "without", "absent"],
+            ["subdural", "sdh", "has", "present"],
+        ],
+        ["sdh"],
+    )
+
+    df = annotate_report.duplicate_targets(df)
+
+    assert df.values.tolist() == [["sdh, subdural", "sdh", "with, has", "present"]]
+
+
+def test_duplicate_targets_tie_selects_absent_first_for_derived_targets():
+    df = make_report(
+        [
+            ["hemorrhage", "hemorrhage", "no", "absent"],
+            ["hemorrhage", "hemorrhage", "with", "present"],
+        ],
+        ["hemorrhage"],
+    )
+
+    df = annotate_report.duplicate_targets(df)
+
+    assert df.values.tolist() == [["hemorrhage", "hemorrhage", "no", "absent"]]
+
+
+def test_duplicate_targets_combines_every_target_group():
+    # A vote for one target group must not drop the rows of a later target
+    # group before their phrases are combined
+    df = make_report(
+        [
+            ["sah", "sah", "no", "absent"],
+            ["sah", "sah", "with", "present"],
+            ["sah", "sah", "has", "present"],
+            ["sdh", "sdh", "no", "absent"],
+            ["subdural", "sdh", "without", "absent"],
+            ["edh", "edh", "no", "absent"],
+            ["epidural", "edh", "without", "absent"],
+        ],
+        ["sah", "sdh", "edh"],
+    )
+
+    df = annotate_report.duplicate_targets(df)
+
+    assert df.values.tolist() == [
+        ["sah", "sah", "with, has", "present"],
+        ["sdh, subdural", "sdh", "no, without", "absent"],
+        ["edh, epidural", "edh", "no, without", "absent"],
+    ]
+
+
+def test_modifier_type_physician_match():
+    target_list = ["cistern", "gray_white_differentiation", "sah", "sdh", "edh"]
+    df = make_report(
+        [
+            ["cisterns", "cistern", "effaced", "abnormal"],
+            ["gray-white", "gray_white_differentiation", "preserved", "absent"],
+            ["sah", "sah", "abnormal", "abnormal"],
+            ["sdh", "sdh", "normal", "normal"],
+            ["edh", "edh", "default", "absent"],
+        ],
+        target_list,
+    )
+
+    df = annotate_report.modifier_type_physician_match(df, target_list)
+
+    assert annotations(df) == {
+        "cistern": "abnormal",
+        "gray_white_differentiation": "normal",
+        "sah": "present",
+        "sdh": "absent",
+        "edh": "absent",
+    }
+    assert df["modifier_phrase"].tolist() == [
+        "effaced",
+        "preserved",
+        "abnormal",
+        "normal",
+        "default",
+    ]
+
+
+def test_modifier_type_physician_match_leaves_default_normal():
+    df = make_report([["cistern", "cistern", "default", "normal"]], ["cistern"])
+
+    df = annotate_report.modifier_type_physician_match(df, ["cistern"])
+
+    assert df.values.tolist() == [["cistern", "cistern", "default", "normal"]]
+
+
+def test_derive_targets():
+    df = make_report(
+        [
+            ["subdural", "subdural_hemorrhage", "with", "present"],
+            ["hemorrhage", "hemorrhage", "with", "present"],
+            ["fluid", "fluid", "default", "absent"],
+            ["pathology", "intracranial_pathology", "default", "absent"],
+        ],
+        [],
+    )
+    groups = annotate_report.target_group_rows(df)
+
+    df = annotate_report.derive_targets(df, groups)
+
+    assert annotations(df) == {
+        "subdural_hemorrhage": "present",
+        "hemorrhage": "absent",
+        "fluid": "present",
+        "intracranial_pathology": "present",
+    }
+    assert df["modifier_phrase"].tolist() == [
+        "with",
+        "with, is_specific_hemorrhage",
+        "default, is_extraaxial_fluid_collection",
+        "default, is_intracranial_pathology",
+    ]
+
+
+def test_derive_targets_suspected_hemorrhage():
+    df = make_report(
+        [
+            ["epidural", "epidural_hemorrhage", "possible", "suspected"],
+            ["fluid", "fluid", "default", "absent"],
+            ["pathology", "intracranial_pathology", "no", "absent"],
+        ],
+        [],
+    )
+    groups = annotate_report.target_group_rows(df)
+
+    df = annotate_report.derive_targets(df, groups)
+
+    # Intracranial pathology stays absent when its own modifier negates it
+    assert annotations(df) == {
+        "epidural_hemorrhage": "suspected",
+        "fluid": "suspected",
+        "intracranial_pathology": "absent",
+    }
+
+
+def test_derive_targets_from_abnormal_pathology():
+    df = make_report(
+        [
+            ["cisterns", "cistern", "effaced", "abnormal"],
+            ["hemorrhage", "hemorrhage", "default", "absent"],
+            ["pathology", "intracranial_pathology", "default", "absent"],
+        ],
+        ["cistern"],
+    )
+    groups = annotate_report.target_group_rows(df)
+
+    df = annotate_report.derive_targets(df, groups)
+
+    assert annotations(df) == {
+        "cistern": "abnormal",
+        "hemorrhage": "absent",
+        "intracranial_pathology": "present",
+    }
+
+
+def test_run_sorts_and_adds_omitted_targets():
+    df = pd.DataFrame(
+        [
+            ["subdural", "sdh", "no", "absent"],
+            ["sah", "sah", "with", "present"],
+            ["sah", "sah", "has", "present"],
+        ],
+        columns=COLUMNS,
+    )
+
+    df = annotate_report.run(df, ["sah", "sdh", "cistern"])
+
+    assert df[["target_group", "modifier_group"]].astype(str).values.tolist() == [
+        ["cistern", "normal"],
+        ["sah", "present"],
+        ["sdh", "absent"],
+    ]
@@ -0,0 +1,209 @@
+"""Tests for the sentence annotation of tbiExtractor."""
+
+import networkx as nx
+import pytest
+
+import annotate_sentences
+import parse_input
+
+
+@pytest.fixture(scope="module")
+def items():
+    """Lexical targets and lexical modifiers for a few hemorrhage targets."""
+    _, targets, modifiers = parse_input.run(
+        frozenset(["edh", "iph", "sah", "sdh"]), include_targets=["edh", "sdh"]
+    )
+    return targets, modifiers
+
+
+@pytest.fixture(scope="module")
+def regexes(items):
+    """Combined regular expressions of the lexical targets and modifiers."""
+    targets, modifiers = items
+    return (
+        annotate_sentences.compile_item_regex(annotate_sentences.item_regexes(targets)),
+        annotate_sentences.compile_item_regex(
+            annotate_sentences.item_regexes(modifiers)
+        ),
+    )
+
+
+def markup_nodes(markup):
+    """Phrase and group of each node of a sentence markup, sorted."""
+    return sorted((node.getPhrase(), node.categoryString()) for node in markup.nodes())
+
+
+@pytest.mark.parametrize(
+    "sentence",
+    [
+        "no subdural hematoma.",
+        "subdural hematoma.",
+        "no acute findings.",
+        "there is a small subdural hematoma and no epidural hematoma.",
+    ],
+)
+def test_markup_sentence_prefilter_keeps_relations(items, regexes, sentence):
+    targets, modifiers = items
+
+    markup = annotate_sentences.markup_sentence(targets, modifiers, sentence)
+    prefiltered = annotate_sentences.markup_sentence(
+        targets, modifiers, sentence, *regexes
+    )
+
+    assert prefiltered.number_of_edges() == markup.number_of_edges()
+    if markup.number_of_edges() > 0:
+        assert markup_nodes(prefiltered) == markup_nodes(markup)
+
+
+def test_markup_sentence_prefilter_skips_sentences(items, regexes):
+    targets, modifiers = items
+
+    # Without a lexical modifier, the lexical target is not marked up
+    markup = annotate_sentences.markup_sentence(
+        targets, modifiers, "subdural hematoma.", *regexes
+    )
+    assert markup.number_of_nodes() == 0
+
+    markup = annotate_sentences.markup_sentence(
+        targets, modifiers, "no subdural hematoma.", *regexes
+    )
+    assert markup_nodes(markup) == [("no", "absent"), ("subdural hematoma.", "sdh")]
+
+
+def test_run_selects_nearest_modifier(items):
+    targets, modifiers = items
+    doc = parse_input.load_nlp()(
+        "There is a small subdural hematoma and no epidural hematoma."
+    )
+
+    df = annotate_sentences.run(targets, modifiers, doc)
+
+    assert sorted(df.values.tolist()) == [
+        ["epidural hematoma.", "edh", "no", "absent"],
+        ["subdural hematoma ", "sdh", "small", "present"],
+    ]
+
+
+def test_run_lowercases_unaligned_reports(items):
+    # Lowercasing changes the length of the text, so sentences are lowercased
+    # one by one rather than sliced from the lowercased report
+    targets, modifiers = items
+    nlp = parse_input.load_nlp()
+    report = "There is a small Subdural hematoma. No epidural HEMATOMA."
+
+    aligned = annotate_sentences.run(targets, modifiers, nlp(report))
+    unaligned = annotate_sentences.run(targets, modifiers, nlp("İ. " + report))
+
+    assert len("İ".lower()) != len("İ")
+    assert unaligned.values.tolist() == aligned.values.tolist()
+    assert sorted(aligned.values.tolist()) == [
+        ["epidural hematoma.", "edh", "no", "absent"],
+        ["subdural hematoma.", "sdh", "small", "present"],
+    ]
+
+
+class Node:
+    """Node of a sentence markup, as used by distance_pruning."""
+
+    def __init__(self, phrase, group, span, category="target"):
+        self.phrase = phrase
+        self.group = group
+        self.span = span
+        self.category = category
+
+    def getConTextCategory(self):
+        return self.category
+
+    def getPhrase(self):
+        return self.phrase
+
+    def categoryString(self):
+        return self.group
+
+    def getSpan(self):
+        return self.span
+
+
+class Context:
+    """Document of sentence markups, as used by distance_pruning."""
+
+    def __init__(self, target, modifiers):
+        self.graph = nx.DiGraph()
+        self.graph.add_node(target)
+        for modifier in modifiers:
+            self.graph.add_edge(modifier, target)
+
+    def getDocumentGraph(self):
+        return self.graph
+
+
+def modifier(phrase, group, span):
+    return Node(phrase, group, span, category="modifier")
+
+
+def test_distance_pruning_nearest_modifier():
+    target = Node("sdh", "sdh", (10, 15))
+    context = Context(
+        target,
+        [
+            modifier("no", "absent", (0, 2)),
+            modifier("small", "present", (4, 9)),
+            modifier("possible", "suspected", (20, 28)),
+        ],
+    )
+
+    df = annotate_sentences.distance_pruning(context)
+
+    assert df.values.tolist() == [["sdh", "sdh", "small", "present"]]
+
+
+def test_distance_pruning_keeps_tied_modifiers():
+    target = Node("sdh", "sdh", (10, 15))
+    context = Context(
+        target,
+        [
+            modifier("no", "absent", (0, 2)),
+            modifier("small", "present", (4, 8)),
+            modifier("possible", "suspected", (17, 25)),
+        ],
+    )
+
+    df = annotate_sentences.distance_pruning(context)
+
+    assert sorted(df.values.tolist()) == [
+        ["sdh", "sdh", "possible", "suspected"],
+        ["sdh", "sdh", "small", "present"],
+    ]
+
+
+def test_distance_pruning_keeps_all_without_distance():
+    # Modifiers overlapping the target are on neither side of it
+    target = Node("sdh", "sdh", (10, 15))
+    context = Context(
+        target,
+        [
+            modifier("no", "absent", (8, 12)),
+            modifier("small", "present", (12, 20)),
+        ],
+    )
+
+    df = annotate_sentences.distance_pruning(context)
+
+    assert sorted(df.values.tolist()) == [
+        ["sdh", "sdh", "no", "absent"],
+        ["sdh", "sdh", "small", "present"],
+    ]
+
+
+def test_distance_pruning_skips_targets_without_modifiers():
+    context = Context(Node("sdh", "sdh", (10, 15)), [])
+
+    df = annotate_sentences.distance_pruning(context)
+
+    assert df.empty
+    assert df.columns.tolist() == [
+        "target_phrase",
+        "target_group",
+        "modifier_phrase",
+        "modifier_group",
+    ]
@@ -0,0 +1,159 @@
+"""Tests for the orchestration of tbiExtractor."""
+
+import os
+
+import pytest
+
+import parse_input
+import run_algorithm
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+REPORT_ONE = os.path.join(EXAMPLES, "report_one.txt")
+REPORT_TWO = os.path.join(EXAMPLES, "report_two.txt")
+
+# Annotations of the example reports with the standard target list
+ANNOTATIONS_ONE = [
+    ["contusion", "absent"],
+    ["diffuse_axonal", "present"],
+    ["edema", "absent"],
+    ["edh", "absent"],
+    ["herniation", "absent"],
+    ["iph", "present"],
+    ["ischemia", "absent"],
+    ["ivh", "present"],
+    ["midline_shift", "absent"],
+    ["sah", "present"],
+    ["sdh", "absent"],
+    ["skull_fracture", "absent"],
+]
+ANNOTATIONS_TWO = [
+    ["contusion", "absent"],
+    ["diffuse_axonal", "present"],
+    ["edema", "present"],
+    ["edh", "absent"],
+    ["herniation", "absent"],
+    ["iph", "absent"],
+    ["ischemia", "absent"],
+    ["ivh", "absent"],
+    ["midline_shift", "absent"],
+    ["sah", "absent"],
+    ["sdh", "absent"],
+    ["skull_fracture", "present"],
+]
+
+
+def rows(df):
+    """Rows of an annotation dataframe as lists of strings."""
+    return df.astype(str).values.tolist()
+
+
+def test_run():
+    df = run_algorithm.run(REPORT_ONE)
+
+    assert df.columns.tolist() == ["target_group", "modifier_group"]
+    assert rows(df) == ANNOTATIONS_ONE
+
+
+def test_run_saves_phrases():
+    df = run_algorithm.run(
+        REPORT_ONE,
+        save_target_phrases=True,
+        save_modifier_phrases=True,
+        include_targets=["sah", "midline_shift"],
+    )
+
+    assert df.columns.tolist() == [
+        "target_phrase",
+        "target_group",
+        "modifier_phrase",
+        "modifier_group",
+    ]
+    assert rows(df[["target_group", "modifier_group"]]) == [
+        ["midline_shift", "absent"],
+        ["sah", "present"],
+    ]
+
+
+def test_run_batch_repeated_reports():
+    df = run_algorithm.run_batch([REPORT_ONE, REPORT_TWO, REPORT_ONE])
+
+    assert df.columns.tolist() == ["report_file", "target_group", "modifier_group"]
+    assert df["report_file"].tolist() == (
+        [REPORT_ONE] * len(ANNOTATIONS_ONE)
+        + [REPORT_TWO] * len(ANNOTATIONS_TWO)
+        + [REPORT_ONE] * len(ANNOTATIONS_ONE)
+    )
+    assert rows(df[["target_group", "modifier_group"]]) == (
+        ANNOTATIONS_ONE + ANNOTATIONS_TWO + ANNOTATIONS_ONE
+    )
+
+
+def test_run_batch_workers():
+    report_files = [REPORT_ONE, REPORT_TWO, REPORT_ONE]
+
+    df = run_algorithm.run_batch(report_files, include_targets=["sah", "edema"])
+    df_workers = run_algorithm.run_batch(
+        report_files, include_targets=["sah", "edema"], workers=2
+    )
+
+    assert rows(df_workers) == rows(df)
+
+
+def test_run_batch_iterable():
+    df = run_algorithm.run_batch(iter([REPORT_TWO, REPORT_ONE]))
+
+    assert rows(df) == [[REPORT_TWO] + row for row in ANNOTATIONS_TWO] + [
+        [REPORT_ONE] + row for row in ANNOTATIONS_ONE
+    ]
+
+
+def test_run_batch_empty():
+    df = run_algorithm.run_batch([], save_modifier_phrases=True)
+
+    assert df.empty
+    assert df.columns.tolist() == [
+        "report_file",
+        "target_group",
+        "modifier_phrase",
+        "modifier_group",
+    ]
+
+
+def test_run_iter():
+    report_files = [REPORT_ONE, REPORT_TWO]
+
+    annotations = list(run_algorithm.run_iter(iter(report_files)))
+
+    assert [list(map(str, row)) for row in annotations] == rows(
+        run_algorithm.run_batch(report_files)
+    )
+
+
+def test_parse_input_standard_targets():
+    specified_targets, _, _ = parse_input.run(run_algorithm.TARGETS_SET)
+
+    assert specified_targets == sorted(run_algorithm.TARGETS_SET - {"anoxic"})
+
+
+def test_parse_input_include_targets():
+    specified_targets, targets, _ = parse_input.run(
+        run_algorithm.TARGETS_SET, include_targets=["anoxic", "sah", "unknown"]
+    )
+
+    assert specified_targets == ["anoxic", "sah"]
+    assert {target.categoryString() for target in targets} == {"anoxic", "sah"}
+
+
+def test_parse_input_exclude_targets():
+    specified_targets, _, _ = parse_input.run(
+        run_algorithm.TARGETS_SET, exclude_targets=["sah"]
+    )
+
+    assert specified_targets == sorted(run_algorithm.TARGETS_SET - {"sah"})
+
+
+def test_parse_input_include_and_exclude_targets():
+    with pytest.raises(SystemExit):
+        parse_input.run(
+            run_algorithm.TARGETS_SET, include_targets=["sah"], exclude_targets=["sdh"]
+        )